@@ -1,13 +1,80 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from datetime import datetime, timedelta
-import json
+from collections import deque
+import logging
+import os
+import threading
+import orjson
 from typing import List, Dict
 
+logger = logging.getLogger(__name__)
+
 # --- Styling and Configuration ---
+# st.plotly_chart serializes through plotly.io; orjson encodes numpy arrays
+# natively instead of going through the stdlib json fallback
+pio.json.config.default_engine = 'orjson'
+
+APP_CSS = """
+    <style>
+    [data-testid="stSidebar"] {
+        background-color: #f8f9fa;
+    }
+    
+    .main {
+        background-color: #FFFFFF;
+    }
+    
+    .stButton > button {
+        background-color: #007AFF;
+        color: white;
+        border-radius: 5px;
+        border: none;
+        padding: 0.5rem 1rem;
+        font-weight: 500;
+    }
+    
+    div[data-testid="stMetricValue"] {
+        font-size: 24px;
+        font-weight: bold;
+    }
+    
+    .agent-card {
+        background-color: #f8f9fa;
+        padding: 1rem;
+        border-radius: 10px;
+        margin: 0.5rem 0;
+    }
+    
+    .metric-container {
+        background-color: white;
+        padding: 1rem;
+        border-radius: 8px;
+        box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+    }
+    
+    /* Device connection styling */
+    .device-status {
+        padding: 10px;
+        border-radius: 5px;
+        margin: 5px 0;
+    }
+    
+    .device-connected {
+        background-color: #e7f5e7;
+        color: #2e7d32;
+    }
+    
+    .device-disconnected {
+        background-color: #ffebee;
+        color: #c62828;
+    }
+    </style>
+"""
+
 def set_page_config():
     st.set_page_config(
         page_title="Diabetes Management System",
@@ -15,80 +82,272 @@ def set_page_config():
         layout="wide"
     )
     
-    # Custom CSS for styling
-    st.markdown("""
-        <style>
-        [data-testid="stSidebar"] {
-            background-color: #f8f9fa;
-        }
-        
-        .main {
-            background-color: #FFFFFF;
-        }
-        
-        .stButton > button {
-            background-color: #007AFF;
-            color: white;
-            border-radius: 5px;
-            border: none;
-            padding: 0.5rem 1rem;
-            font-weight: 500;
-        }
-        
-        div[data-testid="stMetricValue"] {
-            font-size: 24px;
-            font-weight: bold;
-        }
-        
-        .agent-card {
-            background-color: #f8f9fa;
-            padding: 1rem;
-            border-radius: 10px;
-            margin: 0.5rem 0;
-        }
-        
-        .metric-container {
-            background-color: white;
-            padding: 1rem;
-            border-radius: 8px;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        }
-        
-        /* Device connection styling */
-        .device-status {
-            padding: 10px;
-            border-radius: 5px;
-            margin: 5px 0;
-        }
-        
-        .device-connected {
-            background-color: #e7f5e7;
-            color: #2e7d32;
-        }
-        
-        .device-disconnected {
-            background-color: #ffebee;
-            color: #c62828;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Must be emitted on every run: Streamlit removes elements a rerun skips
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # --- Data Management ---
+# One append-only JSON Lines file per category, so saving a record never
+# rewrites the existing history
+DATA_FILES = {
+    'glucose_readings': 'glucose_readings.jsonl',
+    'medications': 'medications.jsonl',
+    'meals': 'meals.jsonl',
+    'exercise': 'exercise.jsonl'
+}
+LEGACY_DATA_FILE = 'diabetes_data.json'
+
+@st.cache_resource
+def data_file_lock():
+    # Streamlit re-executes this script on every run, so a plain module-level
+    # lock would not be shared; cache_resource gives one per server process
+    return threading.Lock()
+
+def migrate_legacy_data():
+    if not os.path.exists(LEGACY_DATA_FILE):
+        return
+    
+    # Sessions starting together on the first launch must not race on the
+    # temp files, or replace a .jsonl another session has already appended to
+    with data_file_lock():
+        try:
+            with open(LEGACY_DATA_FILE, 'rb') as f:
+                legacy = orjson.loads(f.read())
+        except FileNotFoundError:
+            # Another session finished the migration while we waited
+            return
+        
+        # Write every category to a temp file first and only rename the legacy
+        # file away once all of them are in place, so a crash part-way through
+        # leaves the migration to be redone on the next start
+        for category, path in DATA_FILES.items():
+            with open(path + '.tmp', 'wb') as f:
+                for record in legacy.get(category, []):
+                    f.write(orjson.dumps(record) + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+        for path in DATA_FILES.values():
+            os.replace(path + '.tmp', path)
+        os.replace(LEGACY_DATA_FILE, LEGACY_DATA_FILE + '.migrated')
+
+def read_records(path):
+    records = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # An unterminated last line is a torn append (repaired by the
+                # next save_data) or another session's write in flight, so it
+                # is skipped without touching the shared file. A bad line
+                # anywhere else is real corruption and must not be hidden
+                if line.endswith(b'\n'):
+                    raise
+                logger.warning("Skipping partially written record at the end of %s", path)
+    return records
+
 def load_or_create_data():
+    migrate_legacy_data()
+    
+    data = {}
+    for category, path in DATA_FILES.items():
+        try:
+            data[category] = read_records(path)
+        except FileNotFoundError:
+            data[category] = []
+    return data
+
+def repair_torn_tail(f):
+    # Only called under data_file_lock, so an unterminated last line is left
+    # over from a crash mid-append, never another session's write in progress
+    size = f.seek(0, os.SEEK_END)
+    if not size:
+        return
+    f.seek(size - 1)
+    if f.read(1) == b'\n':
+        return
+    
+    f.seek(0)
+    content = f.read()
+    start = content.rfind(b'\n') + 1
     try:
-        with open('diabetes_data.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {
-            'glucose_readings': [],
-            'medications': [],
-            'meals': [],
-            'exercise': []
-        }
+        orjson.loads(content[start:])
+    except orjson.JSONDecodeError:
+        logger.warning("Truncating partially written record at the end of %s", f.name)
+        f.truncate(start)
+    else:
+        f.write(b'\n')
+
+def save_data(category, record):
+    with data_file_lock(), open(DATA_FILES[category], 'a+b') as f:
+        repair_torn_tail(f)
+        f.write(orjson.dumps(record) + b'\n')
+
+def build_glucose_frame(readings):
+    df = pd.DataFrame(readings, columns=['timestamp', 'value', 'notes'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', cache=True)
+    # Readings are whole mg/dL in 0-500: a fixed uint16 keeps appended rows
+    # and the empty frame on the same dtype, so concat never upcasts
+    df['value'] = df['value'].astype(np.uint16)
+    df['hour'] = df['timestamp'].dt.hour.astype(np.uint8)
+    # Time ranges are taken as tail slices, which relies on sorted timestamps
+    if not df['timestamp'].is_monotonic_increasing:
+        df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+    return df
+
+def format_recent_activity(df):
+    # Uses the already-parsed timestamp column; rows come back oldest first
+    return list(zip(df['value'].tolist(), df['timestamp'].dt.strftime('%I:%M %p').tolist()))
+
+def build_recent_activity(df):
+    # Newest first, pre-formatted for the dashboard's Recent Activity list
+    return deque(reversed(format_recent_activity(df.iloc[-5:])), maxlen=5)
+
+def log_glucose_reading(new_reading):
+    # The parsed frame, running stats and recent-activity list are extended
+    # here rather than rebuilt from the full history on the next render
+    row = build_glucose_frame([new_reading])
+    df = st.session_state.glucose_df
+    # Naive local timestamps can step backwards (DST fall-back, clock
+    # corrections); searchsorted and the window cache keys need order
+    if not df.empty and row['timestamp'].iat[0] < df['timestamp'].iat[-1]:
+        updated = pd.concat([df, row], ignore_index=True).sort_values(
+            'timestamp', kind='stable', ignore_index=True
+        )
+        st.session_state.glucose_df = updated
+        # The new point lands mid-series, so the tail views are rebuilt
+        st.session_state.recent_fig = build_recent_figure(updated)
+        st.session_state.recent_activity = build_recent_activity(updated)
+    else:
+        st.session_state.glucose_df = row if df.empty else pd.concat([df, row], ignore_index=True)
+        extend_recent_figure(st.session_state.recent_fig, row)
+        st.session_state.recent_activity.extendleft(format_recent_activity(row))
+    update_glucose_stats(st.session_state.glucose_stats, new_reading['value'])
+    save_data('glucose_readings', new_reading)
+
+# --- Running Statistics ---
+# All-time glucose stats kept up to date on every save (Welford's algorithm),
+# so the analytics page never re-reduces the full history
+def init_glucose_stats(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None}
+    mean = values.mean()
+    deviations = values - mean
+    return {
+        'n': len(values),
+        'mean': float(mean),
+        'm2': float(np.dot(deviations, deviations)),
+        'min': float(values.min()),
+        'max': float(values.max())
+    }
+
+def update_glucose_stats(stats, value):
+    stats['n'] += 1
+    delta = value - stats['mean']
+    stats['mean'] += delta / stats['n']
+    stats['m2'] += delta * (value - stats['mean'])
+    stats['min'] = value if stats['min'] is None else min(stats['min'], value)
+    stats['max'] = value if stats['max'] is None else max(stats['max'], value)
+
+def summarize_glucose_stats(stats):
+    # Sample std dev, matching pandas' Series.std()
+    std = (stats['m2'] / (stats['n'] - 1)) ** 0.5 if stats['n'] > 1 else float('nan')
+    return stats['mean'], std, stats['min'], stats['max']
+
+# --- Chart Helpers ---
+MAX_PLOT_POINTS = 2000
+GLUCOSE_LABEL = 'Blood Glucose (mg/dL)'
+CHART_BACKGROUND = dict(plot_bgcolor='white', paper_bgcolor='white')
+TREND_MARGIN = dict(t=20, l=40, r=20, b=40)
+
+def lttb_downsample(x, y, n_out=MAX_PLOT_POINTS):
+    # Largest-Triangle-Three-Buckets: keep the point in each bucket that forms
+    # the largest triangle with the previous pick and the next bucket's mean
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return x, y
+    
+    xf = (x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x).astype(np.float64)
+    yf = y.astype(np.float64)
+    every = (n - 2) / (n_out - 2)
+    
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = xf[end:next_end].mean()
+        avg_y = yf[end:next_end].mean()
+        area = np.abs(
+            (xf[a] - avg_x) * (yf[start:end] - yf[a])
+            - (xf[a] - xf[start:end]) * (avg_y - yf[a])
+        )
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    
+    return x[idx], y[idx]
+
+@st.cache_data(max_entries=32)
+def _build_glucose_trend(count, last_timestamp, _df):
+    x, y = lttb_downsample(_df['timestamp'].to_numpy(), _df['value'].to_numpy())
+    # Plotly 6 sends epoch milliseconds and float32 as binary typed arrays;
+    # datetime64 would be expanded to a list of ISO strings
+    return x.astype('datetime64[ms]').astype(np.int64).astype(np.float64), y.astype(np.float32)
 
-def save_data(data):
-    with open('diabetes_data.json', 'w') as f:
-        json.dump(data, f)
+RECENT_POINTS = 10
+
+def build_recent_figure(df):
+    recent = df.iloc[-RECENT_POINTS:]
+    fig = go.Figure(go.Scattergl(
+        x=recent['timestamp'].to_numpy(),
+        y=recent['value'].to_numpy(),
+        mode='lines'
+    ))
+    fig.update_layout(
+        xaxis_title='Time',
+        yaxis_title=GLUCOSE_LABEL,
+        margin=TREND_MARGIN,
+        **CHART_BACKGROUND
+    )
+    return fig
+
+def extend_recent_figure(fig, row):
+    # Equivalent of Plotly's extendTraces with a fixed-size window
+    trace = fig.data[0]
+    trace.x = np.append(trace.x, row['timestamp'].to_numpy())[-RECENT_POINTS:]
+    trace.y = np.append(trace.y, row['value'].to_numpy())[-RECENT_POINTS:]
+
+def glucose_trend(df):
+    # Readings are append-only, so length + newest timestamp identify the frame
+    return _build_glucose_trend(len(df), df['timestamp'].iat[-1], df)
+
+def window_key(df):
+    # A time window of the sorted, append-only history is identified by its
+    # size and end points
+    if df.empty:
+        return 0, None, None
+    return len(df), df['timestamp'].iat[0], df['timestamp'].iat[-1]
+
+@st.cache_data(max_entries=32)
+def _build_glucose_histogram(key, _values):
+    return np.histogram(_values, bins=30)
+
+def glucose_histogram(df):
+    return _build_glucose_histogram(window_key(df), df['value'].to_numpy())
+
+@st.cache_data(max_entries=32)
+def _build_hourly_profile(key, _hours, _values):
+    counts = np.bincount(_hours, minlength=24)
+    sums = np.bincount(_hours, weights=_values, minlength=24)
+    observed = np.flatnonzero(counts)
+    return observed, sums[observed] / counts[observed]
+
+def hourly_profile(df):
+    return _build_hourly_profile(window_key(df), df['hour'].to_numpy(), df['value'].to_numpy())
 
 # --- Device Connection Management ---
 def show_device_connection():
@@ -146,6 +405,7 @@ def show_device_connection():
 # --- Main Application Pages ---
 def show_dashboard():
     st.title("Dashboard")
+    glucose_df = st.session_state.glucose_df
     
     # Quick Stats
     col1, col2, col3 = st.columns(3)
@@ -170,36 +430,37 @@ def show_dashboard():
     
     # Glucose Chart
     st.header("Glucose Trends")
-    if st.session_state.data['glucose_readings']:
-        df = pd.DataFrame(st.session_state.data['glucose_readings'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        fig = px.line(
-            df, 
-            x='timestamp', 
-            y='value',
-            labels={'value': 'Blood Glucose (mg/dL)', 'timestamp': 'Time'}
-        )
+    if not glucose_df.empty:
+        x, y = glucose_trend(glucose_df)
+        fig = go.Figure(go.Scattergl(
+            x=x,
+            y=y,
+            mode='lines'
+        ))
         fig.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            margin=dict(t=20, l=40, r=20, b=40)
+            xaxis_title='Time',
+            xaxis_type='date',
+            yaxis_title=GLUCOSE_LABEL,
+            margin=TREND_MARGIN,
+            **CHART_BACKGROUND
         )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True, key="dashboard_trend")
     else:
         st.info("No glucose readings available. Start logging to see trends!")
     
     # Recent Logs
     st.header("Recent Activity")
-    if st.session_state.data['glucose_readings']:
-        for reading in reversed(st.session_state.data['glucose_readings'][-5:]):
+    if st.session_state.recent_activity:
+        for value, time_label in st.session_state.recent_activity:
             st.markdown(f"""
             <div class="metric-container">
-                🔵 {reading['value']} mg/dL at {datetime.fromisoformat(reading['timestamp']).strftime('%I:%M %p')}
+                🔵 {value} mg/dL at {time_label}
             </div>
             """, unsafe_allow_html=True)
     else:
         st.info("No recent activity to display")
 
+@st.fragment
 def show_data_entry():
     st.title("Log Data")
     
@@ -218,93 +479,99 @@ def show_data_entry():
                     "value": reading,
                     "notes": notes
                 }
-                st.session_state.data['glucose_readings'].append(new_reading)
-                save_data(st.session_state.data)
+                log_glucose_reading(new_reading)
                 st.success("Reading saved successfully!")
         
         with col2:
-            if st.session_state.data['glucose_readings']:
-                df = pd.DataFrame(st.session_state.data['glucose_readings'][-10:])
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                fig = px.line(df, x='timestamp', y='value',
-                            labels={'value': 'Blood Glucose (mg/dL)', 'timestamp': 'Time'})
-                fig.update_layout(
-                    plot_bgcolor='white',
-                    paper_bgcolor='white',
-                    margin=dict(t=20, l=40, r=20, b=40)
-                )
-                st.plotly_chart(fig)
+            if not st.session_state.glucose_df.empty:
+                st.plotly_chart(st.session_state.recent_fig, key="recent_readings")
 
 def show_analytics():
     st.title("Analytics")
     
-    if not st.session_state.data['glucose_readings']:
+    if st.session_state.glucose_df.empty:
         st.warning("No data available for analysis. Please log some readings first.")
         return
     
+    show_analytics_window()
+
+# Changing the time range reruns only this fragment, not the whole app
+@st.fragment
+def show_analytics_window():
     # Time range selector
     time_range = st.selectbox(
         "Select Time Range",
         ["Last 7 Days", "Last 30 Days", "All Time"]
     )
     
-    df = pd.DataFrame(st.session_state.data['glucose_readings'])
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
+    df = st.session_state.glucose_df
     if time_range == "Last 7 Days":
-        df = df[df['timestamp'] >= datetime.now() - timedelta(days=7)]
+        df = df.iloc[df['timestamp'].searchsorted(datetime.now() - timedelta(days=7)):]
     elif time_range == "Last 30 Days":
-        df = df[df['timestamp'] >= datetime.now() - timedelta(days=30)]
+        df = df.iloc[df['timestamp'].searchsorted(datetime.now() - timedelta(days=30)):]
     
     # Statistics
     st.header("Statistics")
+    if time_range == "All Time":
+        average, std_dev, minimum, maximum = summarize_glucose_stats(st.session_state.glucose_stats)
+    else:
+        values = df['value']
+        average, std_dev, minimum, maximum = values.mean(), values.std(), values.min(), values.max()
+    
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Average", f"{df['value'].mean():.1f}")
+        st.metric("Average", f"{average:.1f}")
     with col2:
-        st.metric("Std Dev", f"{df['value'].std():.1f}")
+        st.metric("Std Dev", f"{std_dev:.1f}")
     with col3:
-        st.metric("Minimum", f"{df['value'].min():.1f}")
+        st.metric("Minimum", f"{minimum:.1f}")
     with col4:
-        st.metric("Maximum", f"{df['value'].max():.1f}")
+        st.metric("Maximum", f"{maximum:.1f}")
     
     # Charts
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.histogram(
-            df, 
-            x='value',
-            title='Glucose Distribution',
-            labels={'value': 'Blood Glucose (mg/dL)', 'count': 'Frequency'}
-        )
+        # Bin on the server so the browser receives 30 bars, not every reading
+        counts, edges = glucose_histogram(df)
+        fig = go.Figure(go.Bar(
+            x=0.5 * (edges[:-1] + edges[1:]),
+            y=counts,
+            width=edges[1] - edges[0]
+        ))
         fig.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white'
+            title='Glucose Distribution',
+            xaxis_title=GLUCOSE_LABEL,
+            yaxis_title='Frequency',
+            **CHART_BACKGROUND
         )
-        st.plotly_chart(fig)
+        st.plotly_chart(fig, key="glucose_distribution")
     
     with col2:
-        df['hour'] = df['timestamp'].dt.hour
-        hourly_avg = df.groupby('hour')['value'].mean().reset_index()
-        fig = px.line(
-            hourly_avg,
-            x='hour',
-            y='value',
-            title='Average by Hour',
-            labels={'value': 'Blood Glucose (mg/dL)', 'hour': 'Hour of Day'}
-        )
+        hours, averages = hourly_profile(df)
+        fig = go.Figure(go.Scattergl(
+            x=hours,
+            y=averages,
+            mode='lines'
+        ))
         fig.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white'
+            title='Average by Hour',
+            xaxis_title='Hour of Day',
+            yaxis_title=GLUCOSE_LABEL,
+            **CHART_BACKGROUND
         )
-        st.plotly_chart(fig)
+        st.plotly_chart(fig, key="hourly_average")
 
 def main():
     set_page_config()
     
     if 'data' not in st.session_state:
         st.session_state.data = load_or_create_data()
+        # Glucose history is only kept in columnar form from here on
+        st.session_state.glucose_df = build_glucose_frame(st.session_state.data.pop('glucose_readings'))
+        st.session_state.recent_fig = build_recent_figure(st.session_state.glucose_df)
+        st.session_state.glucose_stats = init_glucose_stats(st.session_state.glucose_df['value'].to_numpy())
+        st.session_state.recent_activity = build_recent_activity(st.session_state.glucose_df)
     
     # Sidebar navigation
     with st.sidebar: